@@ -1,21 +1,52 @@
 #!/usr/bin/env python3 -Wd -b
 
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 import base64
 from datetime import timedelta, datetime
 from time import sleep, time
+from typing import NamedTuple
 import http.client
+import importlib.util
 import json
 import logging
 import os.path
+import random
+import re
 import socket
 import subprocess
 import sys
-import urllib.parse
+import threading
 
 import yaml
+try:
+    # libyaml C backend: much faster parsing when available
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
 from prometheus_client import CollectorRegistry, Summary, push_to_gateway
 from prometheus_client import Counter
+try:
+    # optional: one HTTP/2 connection multiplexing all BMM requests
+    import httpx
+except ImportError:
+    httpx = None
+if httpx is not None and importlib.util.find_spec('h2') is None:
+    # httpx needs the h2 extra for http2=True and raises ImportError at
+    # client creation without it; treat a bare httpx install as not
+    # having httpx at all so the stdlib fallback still kicks in
+    httpx = None
+try:
+    # optional: much faster de/serialization of the large BMM payloads
+    # (server lists, DHCP logs)
+    import orjson
+except ImportError:
+    orjson = None
+
+if httpx is not None:
+    TIMEOUT_ERRORS = (socket.timeout, httpx.TimeoutException)
+else:
+    TIMEOUT_ERRORS = (socket.timeout,)
 
 from environment_json import create_environment_json
 
@@ -23,8 +54,11 @@ conf = None
 
 class TimedFormatter(logging.Formatter):
     def format(self, record):
-        t = timedelta(seconds=int(record.relativeCreated / 1000))
-        record.elapsed = str(t)
+        # Runs on every log record: plain integer arithmetic instead of
+        # allocating and stringifying a timedelta
+        s = int(record.relativeCreated) // 1000
+        record.elapsed = "{}:{:02d}:{:02d}".format(
+                s // 3600, (s // 60) % 60, s % 60)
         return super(TimedFormatter, self).format(record)
 
 
@@ -41,6 +75,11 @@ log.addHandler(handler)
 # servers available.
 SERVERS_TIMEOUT = 7200
 
+# Matches Build<NNN> Media1 ISOs - general enough for all builds.
+# Compiled once here; the BMM applies it to every ISO listing entry.
+ISO_PATTERN = re.compile(
+    'SUSE\\-CaaS\\-Platform\\-\\d+.\\d+\\-DVD\\-x86_64\\-Build(\\d+)\\-Media1\\.iso$')
+
 AUTOYAST_URL_PATH = "/autoyast"
 AUTOYAST_SIG_CHUNK = """\
     <signature-handling>
@@ -110,12 +149,27 @@ LABEL WipePartitionTables
   APPEND initrd=hpscriptingtoolkit1040/initrd.img root=/dev/ram0 rw ramdisk_size=740100 ide=nodma ide=noraid pnpbios=off network=1 sstk_mount={tftp_ipaddr}:/srv/distros/hpe-scripting-toolkit-linux-10.50-41 sstk_mount_type=nfs sstk_mount_options=ro,nolock numa=off sstk_conf=toolkit.conf sstk_script=/wipe_partitions.sh
 """
 
+# The templates are constant: bind their format methods once at import
+# time instead of looking them up on every call
+format_node_pxecfg = caasp_node_pxecfg_tpl.format
+format_admin_pxecfg = caasp_admin_pxecfg_tpl.format
+format_wipe_pxecfg = wipe_partition_tables_pxecfg.format
+
 # Prometheus
 
 PROMETHEUS_ADDR = '10.84.72.105:9091'
 PROMETHEUS_SSH = 'root@10.84.72.105'
 PROMETHEUS_JOB_NAME = 'deploy_testbed'
 
+# OpenSSH connection multiplexing: consecutive scp/ssh calls to the
+# same host share one master connection instead of paying a full SSH
+# handshake each
+SSH_MUX_OPTS = [
+    "-o", "ControlMaster=auto",
+    "-o", "ControlPath=/tmp/.ssh-mux-%r@%h:%p",
+    "-o", "ControlPersist=60",
+]
+
 prometheus_reg = CollectorRegistry()
 
 deploy_admin_node_time = Summary(
@@ -132,24 +186,145 @@ deploy_nodes_time = Summary(
 
 tsclient = None
 
+# Cap on concurrent BMM calls to avoid overwhelming the BMM
+MAX_HW_WORKERS = 16
+
+def run_on_all_nodes(fn, items):
+    """Run fn concurrently over items (one thread per node, capped at
+    MAX_HW_WORKERS) and return the results in input order.
+
+    Each BMM call is a full HTTPS round-trip: running them serially
+    makes a N-node cluster pay N round-trip times per phase.
+    """
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_HW_WORKERS, len(items))) as ex:
+        return list(ex.map(fn, items))
+
+def poll_backoff(fn, initial=1.0, cap=30.0, factor=1.5):
+    """Call fn until it returns a non-None value and return it.
+
+    Exponential backoff with a little jitter: the cap keeps the same
+    upper bound on server load as a fixed long interval, while the
+    short initial delays cut the median latency to detect a state
+    transition that happens right after a poll.
+    """
+    delay = initial
+    while True:
+        v = fn()
+        if v is not None:
+            return v
+        sleep(delay + random.random())
+        delay = min(cap, delay * factor)
+
 def make_parent_dirs(fn):
     os.makedirs(os.path.dirname(fn), exist_ok=True)
 
 class APIError(Exception):
     pass
 
+class Server(NamedTuple):
+    """One locked server as returned by the BMM"""
+    name: str
+    serial: str
+    desc: str
+    ilo_ipaddr: str
+    ilo_iface_macaddr: str
+    eth0_macaddr: str
+
 class TestbedServiceClient():
     """Handle interactions with the Bare Metal Manager (BMM)
     """
 
+    # Transport state is shared by every instance, including the
+    # per-host RemoteHWManagers, which all talk to the same BMM: one
+    # SSL context (creating one re-loads the system CA bundle from
+    # disk), and with httpx available one HTTP/2 connection that
+    # multiplexes the concurrent requests from all worker threads with
+    # no head-of-line blocking. Without httpx, fall back to one
+    # keep-alive http.client connection per thread (http.client
+    # connections are not thread-safe).
+    _ssl_ctx = None
+    _client = None
+    _local = threading.local()
+    _transport_lock = threading.Lock()
+
     def __init__(self):
         self._api = conf["bmm_api_address"] if conf else "localhost:8880"
         self._api_token = conf["bmm_token"]
+        self._servers_cache = {}
+        cls = TestbedServiceClient
+        with cls._transport_lock:
+            if cls._ssl_ctx is None:
+                cls._ssl_ctx = http.client.ssl._create_stdlib_context()
+            if httpx is not None and cls._client is None:
+                cls._client = httpx.Client(
+                        base_url='https://{}'.format(self._api), http2=True,
+                        timeout=20, verify=cls._ssl_ctx)
+
+    def _get_conn(self):
+        """Return this thread's persistent keep-alive connection to the
+        BMM, creating it lazily. Reusing one connection avoids paying a
+        TCP + TLS handshake on every API call.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(self._api, timeout=20,
+                    context=self._ssl_ctx)
+            self._local.conn = conn
+        return conn
+
+    def _drop_conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+            self._local.conn = None
+
+    def _request(self, method, tpath, body=None, headers=None):
+        """Perform a request over the persistent connection.
+
+        The BMM can drop an idle keep-alive connection at any time:
+        retry once on a fresh connection in that case.
+        """
+        for retried in (False, True):
+            conn = self._get_conn()
+            try:
+                conn.request(method, tpath, body, headers or {})
+                return conn.getresponse()
+            except socket.timeout:
+                self._drop_conn()
+                raise
+            except (http.client.RemoteDisconnected,
+                    http.client.BadStatusLine, socket.error):
+                self._drop_conn()
+                if retried:
+                    raise
+
+    def _client_call(self, method, tpath, **kw):
+        """Perform a request through the shared httpx client.
+
+        Mirrors _request: the BMM dropping an idle connection surfaces
+        as an httpx.TransportError here; retry once in that case.
+        Timeouts keep propagating so the callers map them to APIError.
+        """
+        for retried in (False, True):
+            try:
+                return self._client.request(method, tpath, **kw)
+            except httpx.TimeoutException:
+                raise
+            except httpx.TransportError:
+                if retried:
+                    raise
 
     def _parse(self, response):
         """Parse JSON response
         """
         try:
+            if orjson is not None:
+                return orjson.loads(response)
             return json.loads(response)
         except Exception as e:
             if 'Internal Server Error' in response:
@@ -161,16 +336,16 @@ class TestbedServiceClient():
                 raise
 
     def _api_get(self, path):
-        ctx = http.client.ssl._create_stdlib_context()
-        conn = http.client.HTTPSConnection(self._api, timeout=20, context=ctx)
         log.info("calling {}/<**token**>{}".format(self._api, path))
         tpath = '/' + self._api_token + path
         # Do not leak out token in production
         # log.info("calling {}{}".format(self._api, tpath))
         try:
-            conn.request('GET', tpath)
-            response = conn.getresponse().read().decode('utf-8')
-        except socket.timeout:
+            if self._client is not None:
+                response = self._client_call('GET', tpath).text
+            else:
+                response = self._request('GET', tpath).read().decode('utf-8')
+        except TIMEOUT_ERRORS:
             log.info("socket timeout")
             raise APIError('testbed daemon socket timeout')
         j = self._parse(response)
@@ -178,26 +353,61 @@ class TestbedServiceClient():
             raise APIError(response)
         return j
 
-    def _api_get_raw(self, path):
-        ctx = http.client.ssl._create_stdlib_context()
-        conn = http.client.HTTPSConnection(self._api, timeout=20, context=ctx)
+    def _api_get_stream(self, path, fileobj, chunk=65536):
+        """Stream a raw response body into fileobj in chunks, keeping
+        memory usage flat regardless of the body size
+        """
         log.info("calling {}/<**token**>{}".format(self._api, path))
         tpath = '/' + self._api_token + path
         try:
-            conn.request('GET', tpath)
-            return conn.getresponse().read()
-        except socket.timeout:
+            if self._client is not None:
+                # Retry once on a dropped connection, like _request,
+                # but only before any bytes reached the file
+                wrote = False
+                for retried in (False, True):
+                    try:
+                        with self._client.stream('GET', tpath) as resp:
+                            for b in resp.iter_bytes(chunk):
+                                fileobj.write(b)
+                                wrote = True
+                        return
+                    except httpx.TimeoutException:
+                        raise
+                    except httpx.TransportError:
+                        if retried or wrote:
+                            raise
+            resp = self._request('GET', tpath)
+            while True:
+                b = resp.read(chunk)
+                if not b:
+                    break
+                fileobj.write(b)
+        except TIMEOUT_ERRORS:
             log.info("socket timeout")
             raise APIError('testbed daemon socket timeout')
 
     def _api_post(self, path, params):
-        ctx = http.client.ssl._create_stdlib_context()
-        conn = http.client.HTTPSConnection(self._api, timeout=20, context=ctx)
-        params = urllib.parse.urlencode(params)
+        # JSON body: percent-encoding multi-KB payloads (e.g. the
+        # mangled autoyast XML) as form-urlencoded roughly doubles
+        # their size and is much slower than json.dumps
+        if orjson is not None:
+            # orjson.dumps emits bytes directly
+            body = orjson.dumps(params)
+        else:
+            body = json.dumps(params).encode('utf-8')
         tpath = '/' + self._api_token + path
-        conn.request('POST', tpath, params)
         log.info("calling {}{}".format(self._api, path))
-        response = conn.getresponse().read().decode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        try:
+            if self._client is not None:
+                response = self._client_call('POST', tpath, content=body,
+                        headers=headers).text
+            else:
+                response = self._request('POST', tpath, body,
+                        headers).read().decode('utf-8')
+        except TIMEOUT_ERRORS:
+            log.info("socket timeout")
+            raise APIError('testbed daemon socket timeout')
         j = self._parse(response)
         if j["status"] != "ok":
             raise APIError(response)
@@ -230,10 +440,21 @@ class TestbedServiceClient():
                 {"conf": content, "macaddr": macaddr}
         )
 
-    def upload_worker_mangled_xml2(self, xml, urlpath):
+    def mangle_and_upload_worker_xml(self, admin_host_ipaddr):
+        """Have the BMM fetch the worker autoyast file from the admin
+        node, inject the given chunks and publish the result under
+        urlpath - one call instead of a fetch + mangle + upload cycle
+        through this client
+        """
+        # this must be matched in the worker PXE file
+        urlpath = "/autoyast/caasp/{}/worker_mangled.xml".format(
+                admin_host_ipaddr)
         log.info("Uploading worker_mangled.xml to {}".format(urlpath))
-        resp = self._api_post('/autoyast/upload_worker_mangled_xml2/',
-                {"xml": xml, "urlpath": urlpath}
+        resp = self._api_post(
+                '/autoyast/mangle_worker_xml/{}'.format(admin_host_ipaddr),
+                {"sig_chunk": AUTOYAST_SIG_CHUNK,
+                 "authorized_keys_chunk": AUTOYAST_AUTHORIZED_KEYS_CHUNK,
+                 "urlpath": urlpath}
         )
 
     def fetch_dhcp_logs(self, from_date):
@@ -241,6 +462,17 @@ class TestbedServiceClient():
         resp = self._api_get('/dhcp/all/{}'.format(tstamp))
         return resp["entries"]
 
+    def lookup_dhcp(self, macaddr, from_date):
+        """Look up the last DHCPACK ipaddr for one MAC, filtered on the
+        BMM side - one small field instead of the whole log window
+
+        :returns: ipaddr or None
+        """
+        tstamp = from_date.strftime("%s")
+        resp = self._api_get('/dhcp/lookup/{}/{}'.format(macaddr.lower(),
+                tstamp))
+        return resp["ipaddr"]
+
     def pick_tftp_dir(self, iso_list_url):
         resp = self._api_post('/iso/pick_tftp_dir', dict(iso_list_url=iso_list_url))
         return resp["tftpdir"]
@@ -250,16 +482,39 @@ class TestbedServiceClient():
         return resp["v"]
 
 
-    def fetch_servers_list(self, testname, master_count, worker_count,
-            want_admin=True, want_nodes=True):
+    def bootstrap(self, testname, iso_list_url):
+        """Fetch the deploy startup state with one composite BMM call
+
+        :returns: {"servers": ..., "tftpdir": ..., "iso_status": ...}
+        """
+        resp = self._api_post('/deploy/bootstrap_state',
+                {"testname": testname, "iso_list_url": iso_list_url})
+        return resp["v"]
+
+    def prime_servers_cache(self, testname, master_count, worker_count,
+            servers):
+        """Seed the server list cache from a bootstrap response,
+        applying the usual locking and validation
+        """
+        self._fetch_servers_raw(testname, master_count, worker_count,
+                servers=servers)
+
+    def _fetch_servers_raw(self, testname, master_count, worker_count,
+            servers=None):
         """Fetch server list from BMM. Lock new servers if needed.
 
-        :returns: [(servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr), ... ]
+        Memoized: the server set is immutable over a deploy run but
+        gets requested by several deploy steps, each an HTTPS
+        round-trip otherwise.
         """
+        key = (testname, master_count, worker_count)
+        if key in self._servers_cache:
+            return self._servers_cache[key]
         # The first server is the admin
         num_servers = 1 + master_count + worker_count
-        resp = self._api_get('/hw/list/{}'.format(testname))
-        servers = resp['v']
+        if servers is None:
+            resp = self._api_get('/hw/list/{}'.format(testname))
+            servers = resp['v']
         if len(servers) == 0:
             # Lock new servers
             resp = self._api_get('/hw/lock/{}/{}/{}'.format(testname, num_servers, SERVERS_TIMEOUT))
@@ -271,9 +526,21 @@ class TestbedServiceClient():
             log.warn("Too many servers are locke: {}".format(len(servers)))
 
         serverlist = [
-            (s['name'], s['serial'], '', s['ilo_ipaddr'], s['macaddr0'], s['macaddr1'])
+            Server(s['name'], s['serial'], '', s['ilo_ipaddr'],
+                s['macaddr0'], s['macaddr1'])
             for s in servers
         ]
+        self._servers_cache[key] = serverlist
+        return serverlist
+
+    def fetch_servers_list(self, testname, master_count, worker_count,
+            want_admin=True, want_nodes=True):
+        """Fetch server list, cached. Lock new servers if needed.
+
+        :returns: [Server, ... ]
+        """
+        serverlist = self._fetch_servers_raw(testname, master_count,
+                worker_count)
         assert want_admin or want_nodes
         if want_admin:
             if want_nodes:
@@ -281,8 +548,12 @@ class TestbedServiceClient():
             return serverlist[:1]
         return serverlist[1:]
 
+    def invalidate_servers_cache(self):
+        self._servers_cache.clear()
+
     def release_servers(self, testname):
         self._api_get('/hw/release/{}'.format(testname))
+        self.invalidate_servers_cache()
 
     def manage_iso(self):
         """Return ISO status"""
@@ -295,10 +566,39 @@ class TestbedServiceClient():
                 iso_pattern=iso_pattern
             ))
 
-    def fetch_syslog_logs(self, ipaddr, from_timestamp):
-        """Fetch Syslog logs from the last boot, for a host, up to a given timestamp
+    def power_on_bulk(self, ipaddrs):
+        """Power on many hosts with one BMM call"""
+        resp = self._api_post('/hosts/power_on_bulk',
+                {"ipaddrs": list(ipaddrs)})
+        return resp["v"]
+
+    def power_off_bulk(self, ipaddrs):
+        """Power off many hosts with one BMM call"""
+        resp = self._api_post('/hosts/power_off_bulk',
+                {"ipaddrs": list(ipaddrs)})
+        return resp["v"]
+
+    def set_one_time_network_boot_bulk(self, ipaddrs):
+        """Set one-time netboot on many hosts with one BMM call"""
+        resp = self._api_post('/hosts/set_one_time_network_boot_bulk',
+                {"ipaddrs": list(ipaddrs)})
+        return resp["v"]
+
+    def power_status_bulk(self, ipaddrs):
+        """Fetch power status for many hosts with one BMM call
+
+        :returns: {ipaddr: power status, ...}
+        """
+        resp = self._api_post('/hosts/power_status_bulk',
+                {"ipaddrs": list(ipaddrs)})
+        return resp["v"]
+
+    def fetch_syslog_logs(self, ipaddr, from_timestamp, fileobj):
+        """Fetch Syslog logs from the last boot, for a host, up to a given
+        timestamp, streaming them into fileobj
         """
-        return self._api_get_raw('/logs/get/{}/{}'.format(ipaddr, from_timestamp))
+        self._api_get_stream('/logs/get/{}/{}'.format(ipaddr, from_timestamp),
+                fileobj)
 
 
 class RemoteHWManager(TestbedServiceClient):
@@ -369,38 +669,52 @@ def write_pxe_file(args, pxe_macaddr, cnf):
 def wipe_admin_node(args):
     admin_node = tsclient.fetch_servers_list(args.testname, args.master_count, args.worker_count, want_admin=True,
             want_nodes=False)[0]
-    servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr = admin_node
-    log.info("---wiping partition table on admin node {} ---".format(servername))
-    write_pxe_file(args, eth0_macaddr,
-            wipe_partition_tables_pxecfg.format(tftp_ipaddr=args.tftp_ipaddr))
+    log.info("---wiping partition table on admin node {} ---".format(admin_node.name))
+    write_pxe_file(args, admin_node.eth0_macaddr,
+            format_wipe_pxecfg(tftp_ipaddr=args.tftp_ipaddr))
 
-    i = HWManager(ilo_ipaddr)
+    i = HWManager(admin_node.ilo_ipaddr)
     i.power_off()
     sleep(10)
-    log.info("Setting netboot {}".format(servername))
+    log.info("Setting netboot {}".format(admin_node.name))
     i.set_one_time_network_boot()
     sleep(10)
-    log.info("powering on {}".format(servername))
+    log.info("powering on {}".format(admin_node.name))
     sleep(10)
     i.power_on()
     sleep(60 * 6)  # TODO: write PXE conf for the next step before sleeping
 
+def wait_power_state(ipaddrs, powered, timeout=30, interval=1):
+    """Poll bulk power status until all hosts reach the wanted state or
+    the timeout expires; return the last status dict.
+
+    Fast clusters get detected within an interval instead of always
+    paying a conservative fixed sleep.
+    """
+    deadline = time() + timeout
+    while True:
+        power = tsclient.power_status_bulk(ipaddrs)
+        if all(bool(power.get(ip)) == powered for ip in ipaddrs):
+            return power
+        if time() >= deadline:
+            return power
+        sleep(interval)
+
 def fetch_and_write_syslog_logs(ipaddr, t0, fname):
     fname = os.path.join(conf['logsdir'], fname)
     log.debug("Writing {}".format(fname))
     make_parent_dirs(fname)
-    syslog_logs = tsclient.fetch_syslog_logs(ipaddr, t0)
     with open(fname, 'wb') as f:
-        f.write(syslog_logs)
+        tsclient.fetch_syslog_logs(ipaddr, t0, f)
 
 @deploy_admin_node_time.time()
 def deploy_admin_node(args):
     t0 = int(time())
     admin_node = tsclient.fetch_servers_list(args.testname, args.master_count, args.worker_count, want_admin=True,
             want_nodes=False)[0]
-    servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr = admin_node
-    log.info("deploying admin node {}".format(servername))
-    caasp_admin_pxecfg = caasp_admin_pxecfg_tpl.format(
+    eth0_macaddr = admin_node.eth0_macaddr
+    log.info("deploying admin node {}".format(admin_node.name))
+    caasp_admin_pxecfg = format_admin_pxecfg(
         tftpdir=args.tftpdir,
         tftp_ipaddr=args.tftp_ipaddr,
         loghost_ipaddr=args.tftp_ipaddr,
@@ -408,29 +722,29 @@ def deploy_admin_node(args):
     )
     write_pxe_file(args, eth0_macaddr, caasp_admin_pxecfg)
 
-    i = HWManager(ilo_ipaddr)
+    i = HWManager(admin_node.ilo_ipaddr)
     i.power_off()
     sleep(10)
-    log.info("setting netboot {}".format(servername))
+    log.info("setting netboot {}".format(admin_node.name))
     i.set_one_time_network_boot()
     sleep(10)
-    log.info("powering on {}".format(servername))
+    log.info("powering on {}".format(admin_node.name))
     power_up_time = datetime.now()
     i.power_on()
 
-    while True:
+    # The lookup is filtered down to one MAC on the BMM side: each poll
+    # transfers a single field instead of the whole log window
+    def check_dhcp():
         log.info("Waiting for DHCP ACK for %s" % eth0_macaddr)
-        ipaddr = parse_dhcp_logs(power_up_time, eth0_macaddr)
-        if ipaddr is not None:
-            log.info("Found ipaddr {}".format(ipaddr))
-            break
-        sleep(30)
+        return tsclient.lookup_dhcp(eth0_macaddr, power_up_time)
+
+    ipaddr = poll_backoff(check_dhcp)
+    log.info("Found ipaddr {}".format(ipaddr))
 
     log.info("Waiting for host to respond to SSH")
-    while True:
-        if tsclient.probe_ssh_port(ipaddr) == "open":
-            break
-        sleep(10)
+    poll_backoff(
+        lambda: True if tsclient.probe_ssh_port(ipaddr) == "open" else None,
+        cap=10.0)
 
     log.info("Sleeping 2 minutes to let the host finish booting")
     sleep(60 * 2)
@@ -444,75 +758,67 @@ def power_off_nodes(args):
     """Power off nodes
     """
     servers = tsclient.fetch_servers_list(args.testname, args.master_count, args.worker_count, want_admin=False, want_nodes=True)
+    hws = [HWManager(s.ilo_ipaddr) for s in servers]
     log.info("Powering off nodes")
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
-        i.power_off()
+    run_on_all_nodes(lambda i: i.power_off(), hws)
 
     sleep(10)
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
+
+    def verify_off(sh):
+        s, i = sh
         if i.get_host_power_status():
-            log.info("Powering {} off again".format(servername))
+            log.info("Powering {} off again".format(s.name))
             i.power_off()
 
+    run_on_all_nodes(verify_off, list(zip(servers, hws)))
+
     log.info("Powering off completed")
 
 
 def fetch_and_mangle_worker_autoyast(admin_host_ipaddr):
-    """Fetch autoyast file and upload it to
+    """Have the BMM mangle the autoyast file and upload it to
     /srv/www/htdocs/autoyast/caasp/worker_mangled.xml
+
+    The BMM fetches the file from the admin node directly, injects the
+    signature-handling and authorized-keys chunks and publishes the
+    result, saving the round-trips through this host.
     """
     assert admin_host_ipaddr
-    log.info("Fetching autoyast file from https://{}{}".format(admin_host_ipaddr,
+    log.info("Mangling autoyast file from https://{}{}".format(admin_host_ipaddr,
         AUTOYAST_URL_PATH))
+    tsclient.mangle_and_upload_worker_xml(admin_host_ipaddr)
 
-    ctx = http.client.ssl._create_stdlib_context()
-    conn = http.client.HTTPSConnection(admin_host_ipaddr, timeout=20, context=ctx)
-    conn.request('GET', AUTOYAST_URL_PATH)
-    ay = conn.getresponse().read().decode('utf-8')
-
-    assert '<pattern>SUSE-CaaSP-Stack</pattern>' in ay, ay
-    xml = ay.replace('</storage>\n', '</storage>\n' + AUTOYAST_SIG_CHUNK)
-
-    # Inject SSH key into authorized keys to allow SSHing to workers
-    xml = xml.replace(
-        '    </chroot-scripts>\n',
-        AUTOYAST_AUTHORIZED_KEYS_CHUNK + '    </chroot-scripts>\n'
-    )
-    # this must be matched in the worker PXE file
-    urlpath = "/autoyast/caasp/{}/worker_mangled.xml".format(admin_host_ipaddr)
-    tsclient.upload_worker_mangled_xml2(xml, urlpath)
-
-
-def parse_dhcp_logs(from_date, macaddr):
-    """Parse dhcpd logs, extract last ipaddr from DHCPACK if found
-    """
-    macaddr = macaddr.lower()
-    entries = tsclient.fetch_dhcp_logs(from_date)
-    return entries.get(macaddr, None)
 
 def wait_dhcp_acks(from_date, servers, max_failing_nodes):
     available_hosts = set()
-    while True:
+    # Advance the fetch window on every poll (with one minute of
+    # overlap for clock skew) and merge new entries locally, so each
+    # fetch transfers only the delta instead of the whole log since
+    # from_date
+    cursor = from_date
+    entries = {}
+
+    def check_acks():
+        nonlocal cursor
         log.info("Waiting for DHCP ACK")
-        entries = tsclient.fetch_dhcp_logs(from_date)
-        for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
+        fetch_start = datetime.now()
+        entries.update(tsclient.fetch_dhcp_logs(cursor))
+        cursor = fetch_start - timedelta(seconds=60)
+        for s in servers:
             try:
-                ipaddr = entries[eth0_macaddr]
+                ipaddr = entries[s.eth0_macaddr]
             except KeyError:
                 continue
-            h = (servername, serial, eth0_macaddr, ipaddr)
+            h = (s.name, s.serial, s.eth0_macaddr, ipaddr)
             if h in available_hosts:
                 continue
-            log.info("Found host {} having ipaddr {}".format(servername, ipaddr))
+            log.info("Found host {} having ipaddr {}".format(s.name, ipaddr))
             available_hosts.add(h)
 
         if len(available_hosts) >= len(servers) - max_failing_nodes:
-            break
-
-        sleep(30)
+            return True
 
+    poll_backoff(check_acks)
     return available_hosts
 
 
@@ -520,60 +826,60 @@ def wait_dhcp_acks(from_date, servers, max_failing_nodes):
 def deploy_nodes(args, admin_host_ipaddr, max_failing_nodes=0):
     servers = tsclient.fetch_servers_list(args.testname, args.master_count, args.worker_count, want_admin=False, want_nodes=True)
 
-    cnf = caasp_node_pxecfg_tpl.format(
+    cnf = format_node_pxecfg(
         admin_host_ipaddr=admin_host_ipaddr,
         tftpdir=args.tftpdir,
         tftp_ipaddr=args.tftp_ipaddr,
         loghost_ipaddr=args.tftp_ipaddr,
     )
 
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        if 'Admin Node' in desc:
+    for s in servers:
+        if 'Admin Node' in s.desc:
             continue
 
-        pxe_macaddr = eth0_macaddr
-        write_pxe_file(args, pxe_macaddr, cnf)
-
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
-        log.info("setting netboot {}".format(servername))
-        try:
-            i.set_one_time_network_boot()
-        except Exception as e:
-            log.info(e)
+        write_pxe_file(args, s.eth0_macaddr, cnf)
+
+    # One bulk BMM call per phase: the BMM fans out to the nodes
+    # internally, so one round-trip replaces N
+    ilo_ipaddrs = [s.ilo_ipaddr for s in servers]
+
+    log.info("setting netboot on all nodes")
+    # A netboot failure on a flaky iLO is not fatal here, matching the
+    # old per-node try/except: the host just shows up later in the
+    # max_failing_nodes accounting
+    try:
+        netboot = tsclient.set_one_time_network_boot_bulk(ilo_ipaddrs)
+    except APIError as e:
+        log.info(e)
+    else:
+        for s in servers:
+            if not netboot.get(s.ilo_ipaddr):
+                log.info("setting netboot failed on {}".format(s.name))
 
     sleep(10)
     rebooted = Counter('deploy_testbed_rebooted_nodes', 'Rebooted nodes',
             registry=prometheus_reg)
     power_up_time = datetime.now()
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
-        # assert i.get_one_time_boot() == 'network', i.get_one_time_boot()
-        # assert i.get_host_power_status() == 'OFF', i.get_host_power_status()
-        log.info("powering on {}".format(servername))
-        i.power_on()
-        rebooted.inc()
-
-    sleep(10)
-
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
-        if not i.get_host_power_status():
-            log.warn("powering {} on again".format(servername))
-            i.power_off()
+    log.info("powering on all nodes")
+    tsclient.power_on_bulk(ilo_ipaddrs)
+    rebooted.inc(len(servers))
 
-    sleep(10)
+    power = wait_power_state(ilo_ipaddrs, True, timeout=30)
+    stragglers = [ip for ip in ilo_ipaddrs if not power.get(ip)]
+    if stragglers:
+        log.warn("powering {} on again".format(stragglers))
+        tsclient.power_off_bulk(stragglers)
 
     av = Counter('deploy_testbed_available_nodes', 'Available and powered up nodes',
             registry=prometheus_reg)
 
     not_powering_up_hosts_cnt = 0
-    for servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr in servers:
-        i = HWManager(ilo_ipaddr)
-        if i.get_host_power_status():
+    power = wait_power_state(ilo_ipaddrs, True, timeout=30)
+    for s in servers:
+        if power.get(s.ilo_ipaddr):
             av.inc()
         else:
-            log.info("BROKEN HOST {} - not powering up".format(servername))
+            log.info("BROKEN HOST {} - not powering up".format(s.name))
             not_powering_up_hosts_cnt += 1
 
     if not_powering_up_hosts_cnt > max_failing_nodes:
@@ -586,26 +892,32 @@ def deploy_nodes(args, admin_host_ipaddr, max_failing_nodes=0):
 def fetch_nodes_syslog_logs(t0, available_hosts):
     """Fetch nodes syslog loggs and store it on disk"""
     # available_hosts is a set of (servername, serial, eth0_macaddr, ipaddr), ...
-    for servername, serial, eth0_macaddr, ipaddr in available_hosts:
+    def fetch_one(h):
+        servername, serial, eth0_macaddr, ipaddr = h
         fn = 'worker_syslog_{}_{}_{}.log'.format(servername, serial, ipaddr)
         fetch_and_write_syslog_logs(ipaddr, t0, fn)
 
+    # The downloads are network-bound: overlap them instead of pulling
+    # one host's syslog at a time
+    run_on_all_nodes(fetch_one, list(available_hosts))
+
 def install_prometheus_certs(kubeconfig):
     log.info("Fetching API client keys for Prometheus")
-    y = yaml.load(kubeconfig)
+    y = yaml.load(kubeconfig, Loader=YamlSafeLoader)
     k = base64.b64decode(y['users'][0]['user']['client-key-data'])
     with open('client_key', 'w') as f:
         f.write(k.decode())
-    subprocess.check_call(["/usr/bin/sudo", "scp",  "client_key",
+    subprocess.check_call(["/usr/bin/sudo", "scp"] + SSH_MUX_OPTS + ["client_key",
         PROMETHEUS_SSH + ":/srv/prometheus/prometheus/kube_api_client_key"])
 
     c = base64.b64decode(y['users'][0]['user']['client-certificate-data'])
     with open('client_cert', 'w') as f:
         f.write(c.decode())
-    subprocess.check_call(["/usr/bin/sudo", "scp", "client_cert",
+    subprocess.check_call(["/usr/bin/sudo", "scp"] + SSH_MUX_OPTS + ["client_cert",
         PROMETHEUS_SSH + ":/srv/prometheus/prometheus/kube_api_client_cert"])
     log.info("Reloading Prometheus")
-    subprocess.check_call(["/usr/bin/sudo", "ssh", PROMETHEUS_SSH, "/usr/bin/systemctl", "reload", "prometheus.service"])
+    subprocess.check_call(["/usr/bin/sudo", "ssh"] + SSH_MUX_OPTS +
+        [PROMETHEUS_SSH, "/usr/bin/systemctl", "reload", "prometheus.service"])
 
 def runcmd(cmd):
     if isinstance(cmd, str):
@@ -631,20 +943,26 @@ def generate_environment_json(admin_host_ipaddr, available_hosts,
         "bogus_mac", admin_host_ipaddr, machine_id))
 
     log.info("Fetching machine IDs")
-    for servername, serial, macaddr, ipaddr in available_hosts:
+
+    def fetch_one(h):
+        servername, serial, macaddr, ipaddr = h
         log.info("Attempting to fetch {} {} machine ID".format(servername, ipaddr))
-        while True:
+
+        def attempt():
             try:
-                machine_id = tsclient.fetch_machine_id(admin_host_ipaddr, ipaddr)
-                available_hosts2.append((servername, serial, macaddr, ipaddr,
-                    machine_id))
-                break
+                return tsclient.fetch_machine_id(admin_host_ipaddr, ipaddr)
             except APIError as e:
                 # 'port 22: No route to host'
                 # 'port 22: Connection refused'
                 if 'Connection timed out' not in str(e):
                     log.info("The host is not ready yet: %s" % str(e))
-                sleep(10)
+
+        machine_id = poll_backoff(attempt, cap=10.0)
+        return (servername, serial, macaddr, ipaddr, machine_id)
+
+    # Fetch concurrently: each host retries independently, so one slow
+    # host no longer blocks the others
+    available_hosts2.extend(run_on_all_nodes(fetch_one, list(available_hosts)))
 
     log.info("Fetching done")
 
@@ -685,13 +1003,10 @@ def handle_iso(args):
         baseurl = j["baseurl"][args.channel]
     iso_list_url = os.path.join(baseurl, 'images/iso')
 
-    # regexp - general enough for all Build<NNN> Media1 ISOs
-    iso_pattern = 'SUSE\\-CaaS\\-Platform\\-\\d+.\\d+\\-DVD\\-x86_64\\-Build(\\d+)\\-Media1\\.iso$'
-
     if args.start_iso_fetching or args.wait_iso_fetching:
         # The BMM will start fetching a new ISO, if available
         log.info("Checking for new ISO")
-        status = tsclient.update_iso(iso_list_url, iso_pattern)
+        status = tsclient.update_iso(iso_list_url, ISO_PATTERN.pattern)
         if status["running"] is None:
             log.info("No new ISO to download")
         else:
@@ -715,6 +1030,23 @@ def handle_iso(args):
             )
             sleep(20)
 
+    if args.tftpdir:
+        # An explicitly requested TFTP dir needs no discovery
+        return args.tftpdir
+
+    if not (args.start_iso_fetching or args.wait_iso_fetching):
+        # Common path: one composite call returns the ISO status, TFTP
+        # dir and server list together, cutting the startup round-trips
+        state = tsclient.bootstrap(args.testname, iso_list_url)
+        if args.wipe_admin or args.admin or args.deploy_nodes or args.poweroff:
+            # Only deploy modes may seed the cache: priming goes
+            # through the usual locking/validation, and a read-only run
+            # (e.g. --prometheus) must not lock hardware or trip the
+            # partial-lock check as a side effect of TFTP dir discovery
+            tsclient.prime_servers_cache(args.testname, args.master_count,
+                    args.worker_count, state["servers"])
+        return state["tftpdir"]
+
     return tsclient.pick_tftp_dir(iso_list_url)
 
 
@@ -760,9 +1092,9 @@ def main():
         # discover admin_host_ipaddr
         admin_node = tsclient.fetch_servers_list(args.testname, args.master_count, args.worker_count, want_admin=True,
             want_nodes=False)[0]
-        servername, serial, desc, ilo_ipaddr, ilo_iface_macaddr, eth0_macaddr = admin_node
         power_up_time = datetime.now() - timedelta(hours=4)
-        admin_host_ipaddr = parse_dhcp_logs(power_up_time, eth0_macaddr)
+        admin_host_ipaddr = tsclient.lookup_dhcp(admin_node.eth0_macaddr,
+                power_up_time)
 
         assert admin_host_ipaddr
         fetch_and_mangle_worker_autoyast(admin_host_ipaddr)